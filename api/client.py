@@ -10,15 +10,19 @@ from urllib3.util.retry import Retry
 
 
 def create_session():
-    """Create a requests session with retry logic"""
+    """Create a requests session with retry logic and connection pooling"""
     session = requests.Session()
+    session.headers.update(
+        {"Content-Type": "application/json", "Connection": "keep-alive"}
+    )
     retries = Retry(
         total=5,
         backoff_factor=1,
         status_forcelist=[500, 502, 503, 504],
         allowed_methods=["POST", "GET"],
     )
-    adapter = HTTPAdapter(max_retries=retries)
+    # Pool sized above the processor's 30 workers so connections are reused
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retries)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
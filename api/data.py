@@ -4,9 +4,25 @@ Author: Johandré van Deventer
 Date: 2025-06-13
 """
 
+import random
 import requests
 import time
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any
+
+try:
+    import orjson as _json
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    import json as _json
+
+
+def _retry_after_seconds(response: Optional[requests.Response]) -> float:
+    """Return the server's Retry-After delay in seconds, or 0 if absent."""
+    if response is None:
+        return 0.0
+    try:
+        return max(float(response.headers.get("Retry-After", 0)), 0.0)
+    except ValueError:
+        return 0.0  # HTTP-date form is not supported
 
 
 def fetch_device_data(
@@ -17,6 +33,7 @@ def fetch_device_data(
     end_time: int,
     max_retries: int = 5,
     initial_backoff: float = 1.0,
+    wait: Optional[Callable[[float], bool]] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Fetch data for a specific device using the access token with robust error handling.
@@ -28,19 +45,19 @@ def fetch_device_data(
         start_time: Start timestamp (seconds)
         end_time: End timestamp (seconds)
         max_retries: Maximum number of retry attempts
-        initial_backoff: Initial backoff time in seconds (doubles each retry)
+        initial_backoff: Initial backoff time in seconds (doubles each retry,
+            randomised with full jitter)
+        wait: Optional replacement for time.sleep between retries, called with
+            the delay in seconds; returning True abandons the request
 
     Returns:
-        JSON response data or None if all retries failed
+        JSON response data, or None if `wait` abandoned the request
 
     Raises:
         requests.exceptions.RequestException: If request fails after all retries
     """
     base_url = "https://globalapi.solarmanpv.com/device/v1.0/historical"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-    }
+    headers = {"Authorization": f"Bearer {access_token}"}
     payload = {
         "timeType": 5,
         "startTime": start_time,
@@ -52,6 +69,7 @@ def fetch_device_data(
     backoff = initial_backoff
 
     while retry_count < max_retries:
+        retry_after = 0.0
         try:
             response = session.post(
                 url=base_url,
@@ -67,16 +85,18 @@ def fetch_device_data(
                 #     f"HTTP {response.status_code}"
                 # )
                 raise requests.exceptions.HTTPError(
-                    f"Server error: HTTP {response.status_code}"
+                    f"Server error: HTTP {response.status_code}", response=response
                 )
 
             response.raise_for_status()
-            # return response.json()
 
+            # raise_for_status() still lets other 2xx/3xx through (e.g. a 204
+            # with no body); only a 200 carries the JSON payload
+            is_ok = response.status_code == 200
             response_payload = {
                 "status": response.status_code,
-                "data": response.json() if response.status_code == 200 else None,
-                "error": response.text if response.status_code != 200 else None,
+                "data": _json.loads(response.content) if is_ok else None,
+                "error": None if is_ok else response.text,
                 "serial": device_id,
                 "start_time": start_time,
                 "end_time": end_time,
@@ -94,22 +114,29 @@ def fetch_device_data(
                 ) from e
 
         except requests.exceptions.HTTPError as e:
+            retry_after = _retry_after_seconds(e.response)
             if retry_count == max_retries - 1:
                 raise requests.exceptions.RequestException(
                     f"API request failed after {max_retries} attempts: {str(e)}"
                 ) from e
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # ValueError: response body was not valid JSON
             # logger.error(f"Request failed: {str(e)}")
             if retry_count == max_retries - 1:
                 raise requests.exceptions.RequestException(
                     f"API request failed after {max_retries} attempts: {str(e)}"
                 ) from e
 
-        # Exponential backoff before retrying
-        sleep_time = min(backoff * (2**retry_count), 60)  # Cap at 60 seconds
+        # Exponential backoff with full jitter so concurrent workers don't retry
+        # in lockstep; honour Retry-After as a lower bound
+        sleep_time = random.uniform(0, min(backoff * (2**retry_count), 60))
+        sleep_time = max(sleep_time, min(retry_after, 60))
         # logger.info(f"Waiting {sleep_time:.1f} seconds before retry...")
-        time.sleep(sleep_time)
+        if wait is None:
+            time.sleep(sleep_time)
+        elif wait(sleep_time):
+            return None
         retry_count += 1
 
     return None
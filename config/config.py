@@ -5,14 +5,30 @@ Date: 2025-06-13
 """
 
 import os
+import pickle
+import struct
+import tempfile
 import threading
 from pathlib import Path
-from typing import Dict, Any, Optional
-import yaml
-from dotenv import load_dotenv
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional
 
 _config_lock = threading.Lock()
-_app_config: Optional[Dict[str, Any]] = None
+_app_config: Optional[Mapping[str, Any]] = None
+
+# Cache header: source file mtime (ns) and size
+_CACHE_HEADER = struct.Struct("=qq")
+
+# Environment overrides: (variable, config key path, value format)
+_ENV_OVERRIDES = (
+    ("API_BASE_URL", ("http_settings", "base_url"), None),
+    ("API_TOKEN", ("http_settings", "headers", "Authorization"), "Bearer {}"),
+    ("API_APP_ID", ("http_settings", "app_id"), None),
+    ("API_APP_SECRET", ("http_settings", "app_secret"), None),
+    ("API_EMAIL", ("http_settings", "email"), None),
+    ("API_PASSWORD", ("http_settings", "password"), None),
+    ("API_ORG_ID", ("http_settings", "org_id"), None),
+)
 
 
 class ConfigError(Exception):
@@ -46,6 +62,8 @@ def _init_environment(env_path: str = ".env") -> bool:
     """
     env_file = Path(env_path)
     if env_file.exists():
+        from dotenv import load_dotenv
+
         load_dotenv(env_file)
         return True
     return False
@@ -55,10 +73,73 @@ def _init_environment(env_path: str = ".env") -> bool:
 _init_environment()
 
 
+def _read_config_cache(
+    cache_file: Path, st: os.stat_result
+) -> Optional[Dict[str, Any]]:
+    """
+    Read a cached configuration if it matches the source file
+
+    Args:
+        cache_file: Path to the cache file
+        st: Stat result of the source configuration file
+
+    Returns:
+        Cached configuration dictionary, or None if missing or stale
+    """
+    try:
+        with cache_file.open("rb") as f:
+            header = f.read(_CACHE_HEADER.size)
+            if header != _CACHE_HEADER.pack(st.st_mtime_ns, st.st_size):
+                return None
+            config = pickle.load(f)
+    except Exception:
+        # Any unreadable cache (bad protocol, missing class, truncation, ...)
+        # just falls back to parsing the YAML
+        return None
+    return config if isinstance(config, dict) else None
+
+
+def _write_config_cache(
+    cache_file: Path, st: os.stat_result, config: Dict[str, Any]
+) -> None:
+    """
+    Atomically write the parsed configuration to the cache file
+
+    Args:
+        cache_file: Path to the cache file
+        st: Stat result of the source configuration file
+        config: Parsed configuration dictionary
+    """
+    temp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(
+            mode="wb",
+            dir=str(cache_file.parent),
+            prefix="config_",
+            suffix=".tmp",
+            delete=False,
+        ) as f:
+            temp_path = Path(f.name)
+            f.write(_CACHE_HEADER.pack(st.st_mtime_ns, st.st_size))
+            pickle.dump(config, f, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_path.replace(cache_file)
+    except OSError:
+        # The cache is an optimisation only; never fail config loading over it
+        if temp_path and temp_path.exists():
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+
+
 def _load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
     """
     Load and parse the YAML configuration file
 
+    The parsed and validated file is cached next to it as ``<name>.yaml.pkl``,
+    keyed on the file's mtime and size, so unchanged configs skip YAML parsing.
+    Environment overrides are never cached.
+
     Args:
         config_path: Path to the configuration file
 
@@ -68,6 +149,7 @@ def _load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
     Raises:
         ConfigFileError: If file is missing or unreadable
         ConfigError: If YAML parsing fails
+        ConfigValidationError: If the parsed configuration is invalid
     """
     config_file = Path(config_path)
 
@@ -76,14 +158,38 @@ def _load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
     if not config_file.is_file():
         raise ConfigFileError(f"Config path is not a file: {config_path}")
 
+    try:
+        st = config_file.stat()
+    except OSError as e:
+        raise ConfigFileError(f"Error reading config file: {str(e)}") from e
+
+    cache_file = config_file.with_suffix(config_file.suffix + ".pkl")
+    config = _read_config_cache(cache_file, st)
+    if config is not None:
+        return config
+
+    # Deferred so cache hits never import PyYAML
+    import yaml
+
+    try:
+        from yaml import CSafeLoader as _SafeLoader
+    except ImportError:  # PyYAML built without LibYAML
+        from yaml import SafeLoader as _SafeLoader
+
     try:
         with config_file.open("r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+            config = yaml.load(f.read(), Loader=_SafeLoader)
     except yaml.YAMLError as e:
         raise ConfigError(f"Invalid YAML in config file: {str(e)}") from e
     except OSError as e:
         raise ConfigFileError(f"Error reading config file: {str(e)}") from e
 
+    # Only cache configs that pass validation
+    _validate_config(config)
+    _write_config_cache(cache_file, st, config)
+
+    return config
+
 
 def _validate_config(config: Dict[str, Any]):
     """
@@ -122,38 +228,38 @@ def _apply_env_overrides(config: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Modified configuration dictionary
     """
-    if "http_settings" not in config:
-        config["http_settings"] = {}
-
-    if os.getenv("API_BASE_URL"):
-        config["http_settings"]["base_url"] = os.getenv("API_BASE_URL")
+    config.setdefault("http_settings", {})
+    env = os.environ  # Populated from .env once at import
 
-    if os.getenv("API_TOKEN"):
-        if "headers" not in config["http_settings"]:
-            config["http_settings"]["headers"] = {}
-        config["http_settings"]["headers"][
-            "Authorization"
-        ] = f"Bearer {os.getenv('API_TOKEN')}"
+    for name, path, fmt in _ENV_OVERRIDES:
+        value = env.get(name)
+        if not value:
+            continue
 
-    if os.getenv("API_APP_ID"):
-        config["http_settings"]["app_id"] = os.getenv("API_APP_ID")
+        section = config
+        for key in path[:-1]:
+            section = section.setdefault(key, {})
+        section[path[-1]] = fmt.format(value) if fmt else value
 
-    if os.getenv("API_APP_SECRET"):
-        config["http_settings"]["app_secret"] = os.getenv("API_APP_SECRET")
+    return config
 
-    if os.getenv("API_EMAIL"):
-        config["http_settings"]["email"] = os.getenv("API_EMAIL")
 
-    if os.getenv("API_PASSWORD"):
-        config["http_settings"]["password"] = os.getenv("API_PASSWORD")
+def _freeze(value: Any) -> Any:
+    """
+    Recursively wrap nested dictionaries in read-only mapping proxies
 
-    if os.getenv("API_ORG_ID"):
-        config["http_settings"]["org_id"] = os.getenv("API_ORG_ID")
+    Args:
+        value: Value to freeze
 
-    return config
+    Returns:
+        The value, with every dictionary replaced by a MappingProxyType
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    return value
 
 
-def get_config(config_path: str = "config.yaml") -> Dict[str, Any]:
+def get_config(config_path: str = "config.yaml") -> Mapping[str, Any]:
     """
     Get the application configuration
 
@@ -161,25 +267,30 @@ def get_config(config_path: str = "config.yaml") -> Dict[str, Any]:
         config_path: Path to the configuration file
 
     Returns:
-        Loaded and validated configuration dictionary
+        Loaded and validated configuration as a read-only mapping, shared
+        between callers
 
     Raises:
         ConfigError: If any configuration operation fails
     """
     global _app_config
 
+    # Fast path once loaded; the frozen config is safe to share without copying
+    if _app_config is not None:
+        return _app_config
+
     with _config_lock:
         if _app_config is None:
             try:
                 config = _load_config(config_path)
                 _validate_config(config)
-                _app_config = _apply_env_overrides(config)
+                _app_config = _freeze(_apply_env_overrides(config))
             except (ConfigFileError, ConfigValidationError, ConfigError) as e:
                 raise ConfigError(
                     f"Configuration initialization failed: {str(e)}"
                 ) from e
 
-        return _app_config.copy()  # Return copy to prevent accidental modification
+        return _app_config
 
 
 def reload_config(config_path: str = "config.yaml"):
@@ -198,6 +309,6 @@ def reload_config(config_path: str = "config.yaml"):
         try:
             config = _load_config(config_path)
             _validate_config(config)
-            _app_config = _apply_env_overrides(config)
+            _app_config = _freeze(_apply_env_overrides(config))
         except (ConfigFileError, ConfigValidationError, ConfigError) as e:
             raise ConfigError(f"Configuration reload failed: {str(e)}") from e
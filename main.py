@@ -27,7 +27,7 @@ def main():
     # =============================================================================
     # STEP 1: INITIALIZATION
     # =============================================================================
-    start_time = time.time()
+    start_time = time.perf_counter()
     print_header(
         f"Starting Data Collection at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
@@ -39,7 +39,7 @@ def main():
     # =============================================================================
     print_header("Loading Configuration")
 
-    load_configuration_start_time = time.time()
+    load_configuration_start_time = time.perf_counter()
 
     try:
         app_config = get_config("config/config.yaml")
@@ -48,7 +48,7 @@ def main():
         print(f"✖  Error loading configuration: {e}")
         return
 
-    load_configuration_end_time = time.time()
+    load_configuration_end_time = time.perf_counter()
     load_configuration_duration = (
         load_configuration_end_time - load_configuration_start_time
     )
@@ -63,7 +63,7 @@ def main():
     # =============================================================================
     print_header("Reading Device IDs from Excel File")
 
-    read_device_id_file_start_time = time.time()
+    read_device_id_file_start_time = time.perf_counter()
 
     try:
         device_id_dir = app_config["input"]["device_ids_directory"]
@@ -80,7 +80,7 @@ def main():
         print(f"✖  Error reading device IDs: {e}")
         return
 
-    read_device_id_file_end_time = time.time()
+    read_device_id_file_end_time = time.perf_counter()
     read_device_id_file_duration = (
         read_device_id_file_end_time - read_device_id_file_start_time
     )
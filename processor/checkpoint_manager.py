@@ -8,20 +8,32 @@ Author: Johandré van Deventer
 Date: 2025-06-13
 """
 
+import atexit
+import gc
 import pickle
 import os
 import tempfile
 import time
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import AbstractSet, Dict, Any, Optional, Set
 
 from utils.utils import print_sub_header
 
 
 class CheckpointManager:
+    # Progress events are appended to a journal next to the checkpoint file;
+    # the full snapshot is only rewritten ("compacted") every COMPACT_EVERY_N
+    # events and on flush/exit
+    COMPACT_EVERY_N = 10_000
+
     def __init__(self, checkpoint_file_path: str):
         self.checkpoint_file_path = checkpoint_file_path
+
+        # Resolve the target and create its directory once, not on every save
+        self._checkpoint_file = Path(checkpoint_file_path).absolute()
+        self._checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+
         self.checkpoint_data = {
             "current_device_index": 0,
             "current_device_serial": None,
@@ -33,32 +45,136 @@ class CheckpointManager:
             "version": "1.0",  # For future compatibility
         }
 
+        self._events = 0  # Journal records since the last compaction
+        self._journal_path = self._checkpoint_file.with_name(
+            self._checkpoint_file.name + ".jrnl"
+        )
+        self._journal = open(self._journal_path, "ab", buffering=0)
+
+        # Fold the journal into a snapshot on a normal interpreter exit
+        atexit.register(self.flush)
+
     def save_checkpoint(
         self,
         device_index: int,
         device_serial: str,
         current_date: str,
-        max_retries: int = 3,
-        retry_delay: float = 0.1,
     ) -> None:
-        """Save current progress to checkpoint file with additional metadata.
+        """Record current progress in the checkpoint journal."""
+        self._record(("M", device_index, device_serial, current_date))
+
+    def flush(self) -> None:
+        """Compact the journal into the snapshot if there are pending events."""
+        if self._events:
+            self.compact()
+
+    def compact(self) -> None:
+        """Write a full snapshot of the checkpoint and truncate the journal."""
+        self._write_now()
+        self._journal.truncate(0)
+        self._events = 0
+
+    def _apply(self, record: tuple) -> None:
+        """Apply a single journal record to the in-memory checkpoint data."""
+        kind = record[0]
+        if kind == "D":
+            _, device_serial, date = record
+            self.checkpoint_data["completed_dates"].setdefault(
+                device_serial, set()
+            ).add(date)
+        elif kind == "C":
+            self.checkpoint_data["completed_devices"].add(record[1])
+        elif kind == "M":
+            _, device_index, device_serial, current_date = record
+            self.checkpoint_data.update(
+                {
+                    "current_device_index": device_index,
+                    "current_device_serial": device_serial,
+                    "current_date": current_date,
+                }
+            )
+
+    def _record(self, record: tuple) -> None:
+        """Apply a record in memory and append it to the journal."""
+        self._apply(record)
+        self._journal.write(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+        self._events += 1
+        if self._events >= self.COMPACT_EVERY_N:
+            self.compact()
+
+    def _replay_journal(self) -> int:
+        """Apply journal records on top of the loaded snapshot.
+
+        A torn record left by an interrupted write is truncated away so new
+        records are appended after the last good one.
+        """
+        replayed = 0
+        with open(self._journal_path, "rb") as f:
+            while True:
+                offset = f.tell()
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    self._journal.truncate(offset)
+                    break
+                self._apply(record)
+                replayed += 1
+        return replayed
+
+    def _write_now(self) -> None:
+        """Atomically write the checkpoint snapshot file."""
+        self.checkpoint_data["last_updated"] = datetime.now().isoformat()
+
+        # Pickling large completed-date sets allocates many objects; keep the
+        # cyclic GC from running mid-dump
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            data = pickle.dumps(self.checkpoint_data, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        if os.name == "posix":
+            self._write_snapshot_posix(data)
+        else:
+            self._write_snapshot_with_retries(data)
+
+    def _write_snapshot_posix(self, data: bytes) -> None:
+        """Write the snapshot with raw os calls; rename is atomic on POSIX."""
+        file = self._checkpoint_file
+        temp_path = f"{file}.tmp"
+
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view) :]
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(temp_path, file)
+        except Exception as e:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass  # Don't mask original error
+            print(f"Failed to save checkpoint: {e}")
+            raise
+
+    def _write_snapshot_with_retries(
+        self, data: bytes, max_retries: int = 3, retry_delay: float = 0.1
+    ) -> None:
+        """Write the snapshot, retrying the rename while Windows holds file locks.
         Args:
+            data: Serialized checkpoint snapshot
             max_retries: Number of attempts to save the checkpoint
             retry_delay: Initial delay between retries (in seconds, increases exponentially)
         """
-        # Update checkpoint data
-        self.checkpoint_data.update(
-            {
-                "current_device_index": device_index,
-                "current_device_serial": device_serial,
-                "current_date": current_date,
-                "last_updated": datetime.now().isoformat(),
-            }
-        )
-
-        # Ensure paths are absolute and directory exists
-        file = Path(self.checkpoint_file_path).absolute()
-        file.parent.mkdir(parents=True, exist_ok=True)
+        file = self._checkpoint_file
 
         last_error = None
         for attempt in range(max_retries):
@@ -73,7 +189,7 @@ class CheckpointManager:
                     delete=False,
                 ) as f:
                     temp_path = Path(f.name)
-                    pickle.dump(self.checkpoint_data, f)
+                    f.write(data)
                     f.flush()
                     os.fsync(f.fileno())
 
@@ -102,61 +218,61 @@ class CheckpointManager:
                     raise  # Re-raise last error if all retries fail
 
         # This should never be reached due to the return/raise above
-        raise RuntimeError("Unexpected error in save_checkpoint")
+        raise RuntimeError("Unexpected error in _write_snapshot_with_retries")
 
     def mark_device_complete(self, device_serial: str) -> None:
         """Mark a device as fully processed."""
-        self.checkpoint_data["completed_devices"].add(device_serial)
-        self.save_checkpoint(
-            self.checkpoint_data["current_device_index"],
-            self.checkpoint_data["current_device_serial"],
-            self.checkpoint_data["current_date"],
-        )
+        self._record(("C", device_serial))
 
     def mark_date_complete(self, device_serial: str, date: str) -> None:
         """Mark a specific date for a device as processed."""
-        if device_serial not in self.checkpoint_data["completed_dates"]:
-            self.checkpoint_data["completed_dates"][device_serial] = set()
-        self.checkpoint_data["completed_dates"][device_serial].add(date)
-        self.save_checkpoint(
-            self.checkpoint_data["current_device_index"],
-            self.checkpoint_data["current_device_serial"],
-            self.checkpoint_data["current_date"],
-        )
+        self._record(("D", device_serial, date))
 
     def load_checkpoint(self) -> Optional[Dict[str, Any]]:
-        """Load progress from checkpoint file if exists."""
-        file = Path(self.checkpoint_file_path)
+        """Load progress from the checkpoint snapshot and journal if they exist."""
+        file = self._checkpoint_file
 
-        if not file.exists():
+        if not file.exists() and self._journal_path.stat().st_size == 0:
             return None
 
         try:
-            with open(file, "rb") as f:
-                loaded_data = pickle.load(f)
+            if file.exists():
+                with open(file, "rb") as f:
+                    loaded_data = pickle.load(f)
+
+                # Merge with current checkpoint data (for new fields)
+                self.checkpoint_data.update(loaded_data)
+
+            self._events = self._replay_journal()
+            checkpoint_data = self.checkpoint_data
 
             print_sub_header("Loading Checkpoint")
             print(
-                f"Resuming from checkpoint created at {loaded_data.get('start_time')}"
+                f"Resuming from checkpoint created at {checkpoint_data.get('start_time')}"
             )
-            print(f"Last updated at {loaded_data.get('last_updated')}")
+            print(f"Last updated at {checkpoint_data.get('last_updated')}")
             print(
-                f"Resuming from device {loaded_data['current_device_index']}, "
-                f"serial {loaded_data['current_device_serial']}, "
-                f"date {loaded_data['current_date']}"
-            )
-            print(
-                f"Completed devices: {len(loaded_data.get('completed_devices', set()))}"
+                f"Resuming from device {checkpoint_data['current_device_index']}, "
+                f"serial {checkpoint_data['current_device_serial']}, "
+                f"date {checkpoint_data['current_date']}"
             )
+            print(f"Completed devices: {len(checkpoint_data['completed_devices'])}")
+            print(f"Replayed journal events: {self._events}")
             print()
 
-            # Merge with current checkpoint data (for new fields)
-            self.checkpoint_data.update(loaded_data)
-            return loaded_data
+            return checkpoint_data
         except Exception as e:
             print(f"Error loading checkpoint: {str(e)}")
             return None
 
+    def get_completed_devices(self) -> Set[str]:
+        """Return the set of fully processed devices (do not modify)."""
+        return self.checkpoint_data["completed_devices"]
+
+    def get_completed_dates(self, device_serial: str) -> AbstractSet[str]:
+        """Return the set of processed dates for a device (do not modify)."""
+        return self.checkpoint_data["completed_dates"].get(device_serial, frozenset())
+
     def is_device_complete(self, device_serial: str) -> bool:
         """Check if a device has been fully processed."""
         return device_serial in self.checkpoint_data["completed_devices"]
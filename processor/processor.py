@@ -6,20 +6,17 @@ Author: Johandré van Deventer
 Date: 2025-06-13
 """
 
-from concurrent.futures import ThreadPoolExecutor
-from queue import Queue
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 from datetime import datetime
-from typing import Any
+from typing import Any, Mapping
 from zoneinfo import ZoneInfo
 
-from tqdm import tqdm
 from api.client import create_session
 from api.auth import get_access_token
 from api.data import fetch_device_data
 from processor.checkpoint_manager import CheckpointManager
-from shutdown.shutdown_controller import is_shutdown_requested
+from shutdown.shutdown_controller import is_shutdown_requested, wait_for_shutdown
 from utils.utils import print_header, print_sub_header
 from utils.dates import (
     get_daily_unix_ranges,
@@ -29,6 +26,8 @@ DELAY_1 = 0  # seconds
 DELAY_2 = 0  # seconds
 DELAY_3 = 0  # seconds
 
+MAX_WORKERS = 30  # Concurrent API requests; keep within the session pool size
+
 
 class DeviceDataProcessorError(Exception):
     """Base exception for device data processor errors."""
@@ -37,12 +36,12 @@ class DeviceDataProcessorError(Exception):
 
 
 class DeviceDataProcessor:
-    def __init__(self, app_config: dict[str, Any], device_map: dict[str, str]):
+    def __init__(self, app_config: Mapping[str, Any], device_map: Mapping[str, str]):
         """
         Initialize the processor with a mapping of device serial numbers to plant names.
 
         Args:
-            device_map (dict[str, str]): Mapping of device serial numbers to plant names.
+            device_map (Mapping[str, str]): Mapping of device serial numbers to plant names.
         """
         self.app_config = app_config
         self.device_map = device_map
@@ -53,6 +52,8 @@ class DeviceDataProcessor:
         self.start_unix = 0
         self.end_unix = 0
         self.date_ranges = []
+        self.date_range_strs = []
+        self.date_ranges_with_str = []
 
         self._prepare_date_ranges()
 
@@ -74,17 +75,15 @@ class DeviceDataProcessor:
 
         print("✔  API session created successfully")
 
-        time.sleep(DELAY_2)
-
     def _fetch_access_token(self):
         print_sub_header("Fetching Access Token")
-        get_access_token_start_time = time.time()
+        get_access_token_start_time = time.perf_counter()
         try:
             self.access_token = get_access_token(self.session)
         except Exception as e:
             raise DeviceDataProcessorError(f"Failed to fetch access token: {e}") from e
 
-        get_access_token_end_time = time.time()
+        get_access_token_end_time = time.perf_counter()
         get_access_token_duration = (
             get_access_token_end_time - get_access_token_start_time
         )
@@ -94,8 +93,6 @@ class DeviceDataProcessor:
         print("✔  Access token fetched successfully")
         print(f"🔑 Access Token: {self.access_token}")
 
-        time.sleep(DELAY_2)
-
     def _prepare_date_ranges(self):
         print_sub_header("Preparing Date Ranges for Data Collection")
 
@@ -107,6 +104,16 @@ class DeviceDataProcessor:
         )
         self.start_unix = self.date_ranges[0][0]
         self.end_unix = self.date_ranges[-1][1]
+
+        # Checkpoint keys for each day, computed once rather than per device/task.
+        # Keys use the host's local timezone, as existing checkpoints do; on a
+        # host behind TZ a key may name the previous calendar day.
+        self.date_range_strs = [
+            datetime.fromtimestamp(start_unix).strftime("%Y-%m-%d")
+            for start_unix, _ in self.date_ranges
+        ]
+        self.date_ranges_with_str = list(zip(self.date_ranges, self.date_range_strs))
+
         start_date_str = datetime.fromtimestamp(self.start_unix, TZ).strftime(
             "%Y-%m-%d"
         )
@@ -145,51 +152,61 @@ class DeviceDataProcessor:
         """
         Get the list of devices that have not been fully processed.
         """
+        completed_devices = self.checkpoint.get_completed_devices()
         remaining_devices = [
             device_serial
             for device_serial in device_ids
-            if not self.checkpoint.is_device_complete(device_serial)
+            if device_serial not in completed_devices
         ]
         return remaining_devices
 
     def _get_remaining_dates(
-        self, device_serial: str, date_ranges: list[tuple[int, int]]
-    ) -> list[tuple[int, int]]:
+        self,
+        device_serial: str,
+        date_ranges_with_str: list[tuple[tuple[int, int], str]],
+    ) -> list[tuple[int, int, str]]:
         """
-        Get the list of date ranges that have not been fully processed for a device.
+        Get the list of date ranges that have not been fully processed for a device,
+        as (start_unix, end_unix, start_date_str) tuples.
         """
-        remaining_dates = []
-
-        for start_unix, end_unix in date_ranges:
-            start_date_obj = datetime.fromtimestamp(start_unix)
-            start_date_str = start_date_obj.strftime("%Y-%m-%d")
-
-            if not self.checkpoint.is_date_complete(device_serial, start_date_str):
-                remaining_dates.append((start_unix, end_unix))
-
+        completed_dates = self.checkpoint.get_completed_dates(device_serial)
+        remaining_dates = [
+            (start_unix, end_unix, start_date_str)
+            for (start_unix, end_unix), start_date_str in date_ranges_with_str
+            if start_date_str not in completed_dates
+        ]
         return remaining_dates
 
-    def process_date(self, args, result_queue: Queue):
-        device_serial, start_unix, end_unix, device_index = args
-        start_date_obj = datetime.fromtimestamp(start_unix)
-        start_date_str = start_date_obj.strftime("%Y-%m-%d")
+    def process_date(self, args) -> tuple[str, str, int] | None:
+        """
+        Fetch one day of data for a device.
+
+        Returns:
+            (device_serial, start_date_str, device_index) for checkpointing,
+            or None if shutdown interrupted the fetch.
+        """
+        device_serial, start_unix, end_unix, device_index, start_date_str = args
 
-        fetch_device_data(
+        data = fetch_device_data(
             self.session,
             self.access_token,
             device_serial,
             start_unix,
             end_unix,
+            # Wake immediately on SIGINT/SIGTERM rather than sleeping out a backoff
+            wait=wait_for_shutdown,
         )
+        if data is None:
+            return None
 
-        result_queue.put((device_serial, start_date_str, device_index))
-
-        return True
+        return device_serial, start_date_str, device_index
 
     def run(self):
         """
         Run the data collection process for all devices and dates.
         """
+        from tqdm import tqdm
+
         print_header("Starting Data Collection")
 
         time.sleep(DELAY_2)
@@ -216,103 +233,124 @@ class DeviceDataProcessor:
                 bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]",
                 position=0,
                 leave=True,
+                mininterval=0.5,
             )
 
-            for device_index, device_serial in enumerate(remaining_devices):
+            # Bound once; called for every completed day in the loop below
+            mark_date_complete = self.checkpoint.mark_date_complete
 
-                site_name = self.device_map[device_serial]
+            # One pool for the whole run; per-device pools cost a thread
+            # startup/teardown cycle for every device
+            with ThreadPoolExecutor(
+                max_workers=MAX_WORKERS, thread_name_prefix="solarman"
+            ) as executor:
+                for device_index, device_serial in enumerate(remaining_devices):
 
-                # Track whether we finished all dates
-                completed_all_dates = True
+                    site_name = self.device_map[device_serial]
 
-                # Get remaining date ranges for the current device
-                remaining_dates = self._get_remaining_dates(
-                    device_serial, self.date_ranges
-                )
+                    # Track whether we finished all dates
+                    completed_all_dates = True
 
-                device_bar = tqdm(
-                    total=len(remaining_dates),
-                    desc=f"Collecting {site_name[:15]}... ({device_serial})",
-                    unit="day",
-                    leave=False,
-                    position=1,
-                    bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]",
-                )
-
-                days_processed = 0
+                    # Get remaining date ranges for the current device
+                    remaining_dates = self._get_remaining_dates(
+                        device_serial, self.date_ranges_with_str
+                    )
 
-                task_args = [
-                    (
-                        device_serial,
-                        start_unix,
-                        end_unix,
-                        device_index,
+                    device_bar = tqdm(
+                        total=len(remaining_dates),
+                        desc=f"Collecting {site_name[:15]}... ({device_serial})",
+                        unit="day",
+                        leave=False,
+                        position=1,
+                        bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]",
+                        # Repaint at most every 0.5 s / 10 days, not per day
+                        mininterval=0.5,
+                        miniters=10,
                     )
-                    for start_unix, end_unix in remaining_dates
-                ]
 
-                try:
-                    result_queue = Queue()
-                    with ThreadPoolExecutor(max_workers=30) as executor:
-                        futures = []
+                    days_processed = 0
+
+                    task_args = [
+                        (
+                            device_serial,
+                            start_unix,
+                            end_unix,
+                            device_index,
+                            start_date_str,
+                        )
+                        for start_unix, end_unix, start_date_str in remaining_dates
+                    ]
+
+                    futures = []
+                    last_date_str = None
+                    try:
                         for args in task_args:
                             if is_shutdown_requested():
                                 completed_all_dates = False
                                 break
 
-                            futures.append(
-                                executor.submit(self.process_date, args, result_queue)
-                            )
+                            futures.append(executor.submit(self.process_date, args))
 
-                        for future in futures:
+                        # Handle days in completion order, not submission order
+                        for future in as_completed(futures):
                             if is_shutdown_requested():
                                 completed_all_dates = False
                                 break
 
-                            future.result()  # This will raise exceptions if any occurred
+                            # This will raise exceptions if any occurred
+                            result = future.result()
+                            if result is None:
+                                # Interrupted by shutdown; day not fetched
+                                completed_all_dates = False
+                                break
+                            device_serial, start_date_str, device_index = result
                             days_processed += 1
                             device_bar.update(1)
 
-                            while not result_queue.empty():
-                                device_serial, start_date_str, device_index = (
-                                    result_queue.get()
-                                )
-                                self.checkpoint.mark_date_complete(
-                                    device_serial, start_date_str
-                                )
-                                self.checkpoint.save_checkpoint(
-                                    device_index, device_serial, start_date_str
-                                )
-
-                except Exception as e:
-                    completed_all_dates = False
-
-                # Handle progress tracking (similar to original code)
-                pre_processed_days = len(self.date_ranges) - len(remaining_dates)
-
-                if not completed_all_dates:
-                    if len(remaining_dates) > days_processed > 0:
-                        progress_devices[device_serial] = days_processed
-                        total_progress_devices[device_serial] = (
-                            days_processed + pre_processed_days
+                            mark_date_complete(device_serial, start_date_str)
+                            last_date_str = start_date_str
+
+                    except Exception as e:
+                        completed_all_dates = False
+
+                    # Record the device's position once per batch, not per day
+                    if last_date_str is not None:
+                        self.checkpoint.save_checkpoint(
+                            device_index, device_serial, last_date_str
                         )
 
-                    if (
-                        days_processed > 0
-                        and days_processed == len(remaining_dates)
-                        and device_serial in progress_devices
-                    ):
-                        del progress_devices[device_serial]
-                        del total_progress_devices[device_serial]
+                    if not completed_all_dates:
+                        # Don't let an aborted device's queued days run on
+                        # into the next device
+                        for future in futures:
+                            future.cancel()
+
+                    # Handle progress tracking (similar to original code)
+                    pre_processed_days = len(self.date_ranges) - len(remaining_dates)
 
-                device_bar.close()
+                    if not completed_all_dates:
+                        if len(remaining_dates) > days_processed > 0:
+                            progress_devices[device_serial] = days_processed
+                            total_progress_devices[device_serial] = (
+                                days_processed + pre_processed_days
+                            )
+
+                        if (
+                            days_processed > 0
+                            and days_processed == len(remaining_dates)
+                            and device_serial in progress_devices
+                        ):
+                            del progress_devices[device_serial]
+                            del total_progress_devices[device_serial]
 
-                # Only mark device as complete if we processed all dates
-                if completed_all_dates:
-                    self.checkpoint.mark_device_complete(device_serial)
-                    processed_devices += 1
+                    device_bar.close()
 
-                    devices_bar.update(1)
+                    # Only mark device as complete if we processed all dates
+                    if completed_all_dates:
+                        self.checkpoint.mark_device_complete(device_serial)
+                        processed_devices += 1
+
+                        devices_bar.update(1)
 
             devices_bar.close()
 
@@ -320,6 +358,9 @@ class DeviceDataProcessor:
             print(f"Error during data collection: {e}")
             raise DeviceDataProcessorError(f"Data collection failed: {e}") from e
         finally:
+            # Fold the checkpoint journal into a fresh snapshot
+            self.checkpoint.flush()
+
             if is_shutdown_requested():
                 print("\nShutdown requested. Running cleanup handlers...", flush=True)
 
@@ -13,6 +13,10 @@ from typing import Callable
 
 _shutdown_requested = threading.Event()
 _cleanup_handlers = []
+# Serialises registration against other threads. It is reentrant so the signal
+# handler, which runs on the main thread, can't deadlock on a registration it
+# interrupted; register_cleanup_handler re-checks the event to cover that case.
+_handlers_lock = threading.RLock()
 
 
 def is_shutdown_requested() -> bool:
@@ -20,21 +24,46 @@ def is_shutdown_requested() -> bool:
     return _shutdown_requested.is_set()
 
 
-def register_cleanup_handler(handler: Callable[[], None]):
-    """Add a cleanup function to be called on shutdown."""
-    _cleanup_handlers.append(handler)
+def wait_for_shutdown(timeout: float | None = None) -> bool:
+    """Block for up to `timeout` seconds; return True as soon as shutdown starts."""
+    return _shutdown_requested.wait(timeout)
+
+
+def register_cleanup_handler(handler: Callable[[], None]) -> bool:
+    """Add a cleanup function to be called on shutdown.
+
+    Returns False (and does not register) if shutdown has already started.
+    """
+    with _handlers_lock:
+        if _shutdown_requested.is_set():
+            return False
+        _cleanup_handlers.append(handler)
+        if _shutdown_requested.is_set():
+            # A signal landed mid-registration. If the handler is still listed,
+            # shutdown took its snapshot before the append, so it won't run.
+            try:
+                _cleanup_handlers.remove(handler)
+            except ValueError:
+                return True  # Included in the snapshot and run
+            return False
+        return True
 
 
 def _trigger_shutdown(signum=None, frame=None):
     """Internal: Signal handler that initiates shutdown."""
-    if not _shutdown_requested.is_set():
+    with _handlers_lock:
+        if _shutdown_requested.is_set():
+            return
         _shutdown_requested.set()
-        # print("\nShutdown requested. Running cleanup handlers...", flush=True)
-        for handler in _cleanup_handlers:
-            try:
-                handler()
-            except Exception as e:
-                print(f"Cleanup error: {e}")
+        handlers = tuple(_cleanup_handlers)
+        _cleanup_handlers.clear()
+
+    # print("\nShutdown requested. Running cleanup handlers...", flush=True)
+    for handler in handlers:
+        try:
+            handler()
+        except Exception as e:
+            print(f"Cleanup error: {e}")
 
 
 # Register for SIGINT (Ctrl+C) and SIGTERM (kill)
@@ -4,7 +4,8 @@ Author: Johandré van Deventer
 Date: 2025-06-13
 """
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from itertools import groupby
 from zoneinfo import ZoneInfo
 from typing import Dict, List, Tuple
 
@@ -16,8 +17,9 @@ def get_daily_unix_ranges(
     date_ranges = []
     tz = ZoneInfo(tz_name)
 
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
+    # Only the calendar day matters; times are rebuilt in `tz` below
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
 
     current_day = start
     while current_day <= end:
@@ -40,10 +42,14 @@ def group_unix_ranges_by_month(
     grouped: Dict[str, List[Tuple[int, int]]] = {}
     tz = ZoneInfo(tz_name)
 
-    for start_unix, end_unix in daily_ranges:
-        dt = datetime.fromtimestamp(start_unix, tz)
-        month_key = dt.strftime("%Y-%m")
-        grouped.setdefault(month_key, []).append((start_unix, end_unix))
+    def year_month(day_range: Tuple[int, int]) -> Tuple[int, int]:
+        dt = datetime.fromtimestamp(day_range[0], tz)
+        return dt.year, dt.month
+
+    # Daily ranges arrive in date order, so each month is one contiguous run;
+    # extending (rather than assigning) keeps unordered input correct too
+    for (year, month), month_ranges in groupby(daily_ranges, key=year_month):
+        grouped.setdefault(f"{year:04d}-{month:02d}", []).extend(month_ranges)
 
     return grouped
 
@@ -4,8 +4,20 @@ Author: Johandré van Deventer
 Date: 2025-06-13
 """
 
-import pandas as pd
+import functools
+import hashlib
+from operator import itemgetter
+import os
+import pickle
+import stat
 from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+# Parsed device maps, one entry per workbook path, tagged with its mtime and size
+_CACHE_DIR = Path(".cache/device_ids")
+# Bump whenever read_device_ids changes what it parses out of the workbook
+_CACHE_VERSION = 3
 
 
 class FileError(Exception):
@@ -14,31 +26,94 @@ class FileError(Exception):
     pass
 
 
-def read_device_ids(file_path: str) -> dict[str, str]:
-    """Reads device IDs from an Excel file and returns a mapping of device serial numbers to their connected plant names."""
+def _device_ids_cache_path(file: Path) -> Path:
+    """Return the cache file for a workbook under the current cache version.
+
+    The name does not depend on mtime or size, so an edited workbook
+    overwrites its previous entry instead of leaving it behind.
+    """
+    key = hashlib.sha1(f"{_CACHE_VERSION}:{file.resolve()}".encode()).hexdigest()
+    return _CACHE_DIR / f"{key}.pkl"
+
+
+def _read_device_ids_cache(
+    cache_path: Path, st: os.stat_result
+) -> Optional[dict[str, str]]:
+    """Load a cached device map, or None if missing, stale or unreadable."""
+    try:
+        mtime_ns, size, device_map = pickle.loads(cache_path.read_bytes())
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        return None
+    if (mtime_ns, size) != (st.st_mtime_ns, st.st_size):
+        return None
+    return device_map
+
+
+def _write_device_ids_cache(
+    cache_path: Path, st: os.stat_result, device_map: dict[str, str]
+) -> None:
+    """Atomically store a device map; failures only cost the next run a parse."""
+    temp_path = cache_path.with_suffix(".tmp")
+    payload = (st.st_mtime_ns, st.st_size, device_map)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path.write_bytes(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        temp_path.replace(cache_path)
+    except OSError:
+        pass
+
+
+@functools.cache
+def read_device_ids(file_path: str) -> Mapping[str, str]:
+    """Reads device IDs from an Excel file and returns a mapping of device serial numbers to their connected plant names.
+
+    Results are memoised per path for the life of the process and returned as a
+    read-only MappingProxyType shared by all callers; copy it with dict() if a
+    mutable mapping is needed. Use read_device_ids.cache_clear() to force a
+    re-read.
+    """
 
     file = Path(file_path)
 
-    if not file.exists():
-        raise FileError(f"File not found at {file_path}")
-    if not file.is_file():
+    # One stat serves both validation and the cache freshness check
+    try:
+        st = os.stat(file)
+    except FileNotFoundError as e:
+        raise FileError(f"File not found at {file_path}") from e
+    except OSError as e:
+        raise FileError(f"Error accessing {file_path}: {str(e)}") from e
+    if not stat.S_ISREG(st.st_mode):
         raise FileError(f"Path is not a file: {file_path}")
 
+    cache_path = _device_ids_cache_path(file)
+    device_map = _read_device_ids_cache(cache_path, st)
+    if device_map is not None:
+        return MappingProxyType(device_map)
+
+    # openpyxl in read-only mode streams just the cells we need instead of
+    # materialising the whole sheet as a DataFrame
+    from openpyxl import load_workbook
+
     try:
-        devices_df = pd.read_excel(file_path)
-        device_map = dict(
-            zip(
-                devices_df["SN"],
-                devices_df["Connected Plant"]
-                # .str.lower()
-                .str.replace("Curro ", ""),
-                # .str.replace(" ", "_"),
-            )
-        )
-
-        sorted_device_map = dict(sorted(device_map.items(), key=lambda item: item[1]))
-        device_map = sorted_device_map
-
-        return device_map
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows)
+            sn_index = header.index("SN")
+            plant_index = header.index("Connected Plant")
+            pairs = [
+                (row[sn_index], row[plant_index].removeprefix("Curro "))
+                for row in rows
+                if row[sn_index] is not None
+            ]
+        finally:
+            workbook.close()
+
+        # Dedupe first so a repeated serial keeps its last row, then sort once
+        device_map = dict(sorted(dict(pairs).items(), key=itemgetter(1)))
     except Exception as e:
         raise FileError(f"Error reading device IDs from {file_path}: {str(e)}") from e
+
+    _write_device_ids_cache(cache_path, st, device_map)
+
+    return MappingProxyType(device_map)
@@ -6,16 +6,23 @@ Author: Johandré van Deventer
 Date: 2025-06-13
 """
 
+import sys
+from functools import lru_cache
+
+
+@lru_cache(maxsize=8)
+def _border(char: str, width: int) -> str:
+    """Return a separator line of `char` repeated `width` times."""
+    return char * width
+
 
 def print_header(header: str = "Header", width: int = 80) -> None:
     """Print a formatted header with a specified width."""
-    print("\n" + "=" * width)
-    print(f"{header.center(width)}")
-    print("=" * width + "\n")
+    border = _border("=", width)
+    sys.stdout.write(f"\n{border}\n{header.center(width)}\n{border}\n\n")
 
 
 def print_sub_header(sub_header: str = "Subheader", width: int = 80) -> None:
     """Print a formatted sub-header with a specified width."""
-    print("\n" + "-" * width)
-    print(f"{sub_header}")
-    print("-" * width + "\n")
+    border = _border("-", width)
+    sys.stdout.write(f"\n{border}\n{sub_header}\n{border}\n\n")